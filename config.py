@@ -4,4 +4,23 @@ USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
 DELAY_BETWEEN_REQUESTS = 10  # 10 secondi come richiesto da robots.txt comune.verona.it
 MAX_DEPTH = 2  # profondità massima di crawling
 DOWNLOAD_FOLDER = "downloaded_pdfs"
-MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB max per PDF
\ No newline at end of file
+MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB max per PDF
+# Logging strutturato: campionamento e limite di eventi ad alto volume
+LOG_SAMPLE_RATES = {}  # es. {'page_visit': 0.1} per tenere il 10% delle visite
+LOG_MAX_EVENTS_PER_SECOND = {}  # es. {'page_visit': 20}, warning ed errori non vengono mai scartati
+
+# Crawling focalizzato: visita prima i link che probabilmente portano a PDF
+FOCUSED_CRAWL = False  # True = best-first, False = BFS
+FOCUS_KEYWORDS = ['pdf', 'download', 'scarica', 'document', 'allegat', 'modul', 'report',
+                  'pubblicazion', 'bando', 'bandi', 'delibera', 'circolar', 'regolament',
+                  'file', 'attachment', 'publication', 'paper', 'manual']
+FOCUS_STATE_FOLDER = None  # es. "crawl_state" per salvare per sito ciò che è stato imparato
+MAX_PAGES = None  # numero massimo di pagine da scaricare (None = nessun limite)
+MIN_YIELD = None  # es. 0.05: si ferma se le ultime YIELD_WINDOW pagine danno meno PDF per pagina
+YIELD_WINDOW = 50  # numero di pagine su cui calcolare la resa marginale
+
+# Salvataggio dei file scaricati
+OUTPUT_BACKEND = "folder"  # "folder" = un file per PDF, "zip" = archivi ZIP a blocchi con indice
+SHARD_MAX_SIZE = 1024 * 1024 * 1024  # 1GB max per archivio ZIP
+SHARD_MAX_ENTRIES = 1000  # file max per archivio ZIP, limita cosa va recuperato dopo un crash
+ARCHIVE_PAGES = False  # True = salva anche le pagine HTML visitate per rileggere il crawl offline
@@ -5,6 +5,12 @@ import time
 import threading
 import sys
 from config import USER_AGENT, DELAY_BETWEEN_REQUESTS, MAX_DEPTH, DOWNLOAD_FOLDER, MAX_FILE_SIZE
+from config import FOCUSED_CRAWL, FOCUS_STATE_FOLDER, MAX_PAGES, MIN_YIELD, YIELD_WINDOW
+from frontier import BFSFrontier, LinkFrontier
+from collections import deque
+import os
+import re
+import hashlib
 import logging
 from tqdm import tqdm
 
@@ -16,7 +22,8 @@ logger = logging.getLogger('crawler')  # Initialize a logger for the crawler
 class WebCrawler:
 
     #WebCrawler initialization
-    def __init__(self, base_url, page_keywords=None):
+    def __init__(self, base_url, page_keywords=None, target_filter=None, document_filter=None,
+                 focused=FOCUSED_CRAWL, max_pages=MAX_PAGES, min_yield=MIN_YIELD, page_archive=None):
         self.crawl_path = {}  # Track the path: {url: parent_url}
         self.base_url = base_url # Base URL to start crawling 
         self.visited_urls = set() # Set to keep track of visited URLs
@@ -25,6 +32,14 @@ class WebCrawler:
         self.session = requests.Session() # Initialize a session for making requests
         self.session.headers.update({'User-Agent': USER_AGENT}) # Initialize session with user agent
         self.stop_crawling = False  # Flag to stop crawling
+        self.target_filter = target_filter  # Function telling if a link is a target (e.g. a wanted PDF)
+        self.document_filter = document_filter  # Function telling if a link is a document (e.g. any PDF), not a page
+        self.focused = focused  # Visit first the links most likely to lead to targets
+        self.max_pages = max_pages  # Stop after fetching this many pages
+        self.min_yield = min_yield  # Stop when the recent pages yield fewer targets per page
+        self.pages_fetched = 0  # Number of pages requested
+        self.recent_yields = deque(maxlen=YIELD_WINDOW)  # New targets found on the last pages
+        self.page_archive = page_archive  # Optional storage where the HTML pages are archived
 
 
     # Start a thread to monitor user input for stopping the crawler
@@ -56,39 +71,58 @@ class WebCrawler:
     
 
     # Get the web page content
-    def get_page(self,url):
+    def get_page(self, url, depth=None):
+
+        parent = self.crawl_path.get(url, 'starting point')  # Show the crawled path
+        start_time = time.perf_counter()
 
         try:
-            # Show the crawled path
-            if url in self.crawl_path:
-                parent = self.crawl_path[url]
-                logger.info(f"Visiting: {url} → (from {parent})")
-            else:
-                logger.info(f"Visiting: {url} → (starting point)")
+            response = self.session.get(url, timeout=10) # Get the page content with a timeout
 
+            logger.info("Visiting: %s → (from %s)", url, parent,
+                        extra={'event': 'page_visit', 'url': url, 'depth': depth,
+                               'status': response.status_code,
+                               'latency': round(time.perf_counter() - start_time, 3)})
 
-            response = self.session.get(url, timeout=10) # Get the page content with a timeout
             response.raise_for_status()  # Raise an error for bad responses
 
             # Check if the content type is HTML
             content_type = response.headers.get('Content-Type', '')
             if 'text/html' not in content_type:
                 return None
+
+            # Archive the page so the crawl can be replayed offline
+            if self.page_archive is not None:
+                self.archive_page(url, response.content, content_type)
             
             soup = BeautifulSoup(response.content, 'html.parser') # Parse the HTML content
             time.sleep(DELAY_BETWEEN_REQUESTS)  # Delay between requests to avoid overloading the server
             return soup
         
         except requests.RequestException as e:
-            logger.error(f"Error fetching {url}: {e}")
+            logger.error("Error fetching %s: %s", url, e,
+                         extra={'event': 'page_error', 'url': url, 'depth': depth,
+                                'latency': round(time.perf_counter() - start_time, 3)})
             return None
 
 
+    # Save the page content in the archive, named after the URL hash
+    def archive_page(self, url, content, content_type):
+        name = f"pages/{hashlib.sha1(url.encode('utf-8')).hexdigest()}.html"
+        if self.page_archive.exists(name):
+            return
+
+        try:
+            self.page_archive.store(name, url, [content], kind='page', content_type=content_type)
+        except OSError as e:
+            logger.error("Error archiving %s: %s", url, e, extra={'event': 'page_error', 'url': url})
+
+
        
     # Extract links from the page content
     def extract_links(self, soup, current_url):
 
-        links = set()
+        links = {} # {url: anchor text}
 
         # Try to find links only in content areas (safer approach)
         content_selectors = [
@@ -101,7 +135,7 @@ class WebCrawler:
         for selector in content_selectors:
             content_areas = soup.select(selector)
             if content_areas:
-                logger.debug(f"Found content area: {selector}")
+                logger.debug("Found content area: %s", selector)
                 for area in content_areas:
                     content_links.extend(area.find_all('a', href=True))
                 break  # Use first found content area
@@ -180,12 +214,13 @@ class WebCrawler:
                 # Check if the URL matches the page keywords
                 if self.matches_page_keywords(clean_url):
 
-                    links.add(clean_url)
-                    self.found_links.add(clean_url)
+                    # Anchor text is only needed to score links in focused mode
+                    anchor_text = link.get_text(' ', strip=True) if self.focused else ''
+                    links[clean_url] = f"{links.get(clean_url, '')} {anchor_text}".strip()
         
         # Log statistics
-        logger.debug(f"Found {len(content_links)} links in content area")
-        logger.debug(f"After filtering: {len(links)} valid links added")
+        logger.debug("Found %d links in content area", len(content_links))
+        logger.debug("After filtering: %d valid links added", len(links))
 
         return links
     
@@ -207,18 +242,65 @@ class WebCrawler:
 
 
     # Primary method to crawl the web starting from the base URL
-    def crawl(self, base_url, max_depth=MAX_DEPTH):
+    def crawl(self, base_url, max_depth=MAX_DEPTH, monitor_input=True):
+
+        # Consume the generator, links are collected in self.found_links
+        for _ in self.iter_crawl(base_url, max_depth=max_depth, monitor_input=monitor_input):
+            pass
+
+
+    # Check if the URL is a target of the crawl
+    def is_target(self, url):
+        return self.target_filter is not None and self.target_filter(url)
+
+
+    # Check if the URL is a document that doesn't need to be fetched as a page
+    def is_document(self, url):
+        return self.document_filter is not None and self.document_filter(url)
+
+
+    # Create the frontier holding the URLs to visit
+    def create_frontier(self):
+        if not self.focused:
+            return BFSFrontier()
+
+        # Optionally persist what was learned for this site
+        state_path = None
+        if FOCUS_STATE_FOLDER:
+            site = re.sub(r'[^A-Za-z0-9_.-]', '_', urlparse(self.base_url).netloc)
+            state_path = os.path.join(FOCUS_STATE_FOLDER, f"{site}.json")
+
+        return LinkFrontier(state_path=state_path)
+
+
+    # Check if the fetch budget is exhausted, returns the reason or None
+    def budget_exhausted(self):
+        if self.max_pages is not None and self.pages_fetched >= self.max_pages:
+            return f"page budget of {self.max_pages} pages reached"
+
+        # Marginal yield over the last pages
+        if (self.min_yield is not None and len(self.recent_yields) == self.recent_yields.maxlen
+                and sum(self.recent_yields) / len(self.recent_yields) < self.min_yield):
+            return f"yield dropped below {self.min_yield} targets per page over the last {len(self.recent_yields)} pages"
+
+        return None
+
+
+    # Crawl the web yielding (link, parent_url, depth) as soon as each new link is found
+    def iter_crawl(self, base_url, max_depth=MAX_DEPTH, monitor_input=True):
 
         logger.info(f"Starting crawl from: {base_url}") # Initialize the stack with the base URL and depth
-        urls_to_visit = [(base_url, 0)] # (url, depth)
+        urls_to_visit = self.create_frontier()
+        urls_to_visit.push(base_url, 0) # (url, depth)
 
         # Start a thread to monitor user input for stopping the crawler
-        self.start_input_monitor()
+        if monitor_input:
+            self.start_input_monitor()
     
 
         # Loop through the URLs to visit
         with tqdm(desc="Crawling pages", unit="pages", dynamic_ncols=True,
-                  mininterval=0.1, maxinterval=1.0) as pbar:
+                  mininterval=0.1, maxinterval=1.0) as pbar, urls_to_visit:
             
             start_time = time.time()
             
@@ -244,7 +326,14 @@ class WebCrawler:
 
 
             while urls_to_visit and not self.stop_crawling:
-                current_url, depth = urls_to_visit.pop(0)
+
+                # Stop when the fetch budget is exhausted
+                reason = self.budget_exhausted()
+                if reason:
+                    logger.info("Stopping crawl: %s", reason)
+                    break
+
+                current_url, depth = urls_to_visit.pop()
 
                 #check if the URL has already been visited
                 if current_url in self.visited_urls:
@@ -267,8 +356,10 @@ class WebCrawler:
                 self.visited_urls.add(current_url)
 
                 # Get the page content
-                soup = self.get_page(current_url)
+                soup = self.get_page(current_url, depth)
+                self.pages_fetched += 1
                 if soup is None:
+                    self.recent_yields.append(0)
                     continue
                     
                 pbar.set_description(f"Extracting links: {urlparse(current_url).path[:20]}")
@@ -281,11 +372,28 @@ class WebCrawler:
                 pbar.update(1) # Increment only if a new page is processed
                 #-----------------------------------
 
-                for link in links:
+                new_targets = 0
+                for link, anchor_text in links.items():
+                    is_target = self.is_target(link)
+
                     if link not in self.visited_urls:
-                        urls_to_visit.append((link, depth + 1))
                         self.crawl_path[link] = current_url # Track the path: remember where this link came from
 
+                        # In focused mode documents are not fetched as pages, wanted or not
+                        if not (self.focused and (is_target or self.is_document(link))):
+                            urls_to_visit.push(link, depth + 1, anchor_text, current_url)
+
+                    # Hand out each link only the first time it is found
+                    if link not in self.found_links:
+                        self.found_links.add(link)
+                        if is_target:
+                            new_targets += 1
+                        yield link, current_url, depth + 1
+
+                # Learn from the page how many new targets it contained
+                urls_to_visit.record_page(current_url, new_targets)
+                self.recent_yields.append(new_targets)
+
 
             # Final progress bar logic
             elapsed = time.time() - start_time
@@ -300,6 +408,8 @@ class WebCrawler:
         # Log crawling statistics
         logger.info(f"Crawling statistics:")
         logger.info(f"- Total URLs visited: {len(self.visited_urls)}")
+        logger.info(f"- Pages fetched: {self.pages_fetched}")
+        logger.info(f"- Crawl mode: {'focused' if self.focused else 'BFS'}")
         logger.info(f"- Total links found: {len(self.found_links)}")
         logger.info(f"- Max depth reached: {max_depth}")
         logger.info(f"- Base domain: {urlparse(self.base_url).netloc}")
@@ -0,0 +1,191 @@
+# Frontiers decide which URL the crawler visits next.
+
+import heapq
+import itertools
+import json
+import os
+import re
+from collections import deque
+from urllib.parse import urlparse
+from config import FOCUS_KEYWORDS
+import logging
+
+
+logger = logging.getLogger('crawler')  # Frontiers log through the crawler logger
+
+
+# Weights of the signals used to score a link
+ANCHOR_WEIGHT = 2.0  # Anchor text contains a focus keyword
+URL_WEIGHT = 1.0  # URL path contains a focus keyword
+SIMILARITY_WEIGHT = 2.0  # URL tokens similar to pages that yielded PDFs
+DIRECTORY_WEIGHT = 3.0  # PDF yield of the directory learned during the run
+DEPTH_PENALTY = 0.5  # Prefer shallower links when scores are similar
+
+# URL tokens too common to say anything about a page
+STOP_TOKENS = {'html', 'htm', 'php', 'asp', 'aspx', 'jsp', 'index', 'www', 'http', 'https'}
+
+
+
+# Breadth-first frontier, visits pages in the order they were found
+class BFSFrontier:
+
+    def __init__(self):
+        self.queue = deque() # (url, depth)
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def push(self, url, depth, anchor_text='', parent_url=None):
+        self.queue.append((url, depth))
+
+    def pop(self):
+        return self.queue.popleft()
+
+    # BFS doesn't learn anything from the visited pages
+    def record_page(self, url, pdf_count):
+        pass
+
+
+
+# Best-first frontier, visits first the links most likely to lead to PDFs
+class LinkFrontier:
+
+    def __init__(self, keywords=None, state_path=None):
+        self.keywords = [k.lower() for k in (keywords if keywords is not None else FOCUS_KEYWORDS)]
+        self.state_path = state_path # Optional JSON file to persist what was learned for the site
+        self.heap = [] # (-score, order, version, url, depth, anchor_text, parent_url)
+        self.counter = itertools.count() # Keeps insertion order for equal scores
+        self.version = 0 # Incremented every time the statistics change
+
+        self.dir_stats = {} # {directory: [pages visited, PDFs found]}
+        self.yield_tokens = {} # {URL token: pages with this token that yielded PDFs}
+        self.yielding_pages = 0 # Number of pages that yielded at least one PDF
+
+        if self.state_path and os.path.exists(self.state_path):
+            self.load_state()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __enter__(self):
+        return self
+
+    # Save what was learned when the crawl ends, even if it was interrupted
+    def __exit__(self, *exc_info):
+        if self.state_path:
+            self.save_state()
+        return False
+
+
+    # Split the URL path and query in lowercase tokens
+    def _tokens(self, url):
+        parsed = urlparse(url)
+        return [t for t in re.split(r'[^a-z0-9]+', f"{parsed.path} {parsed.query}".lower()) if len(t) > 2 and t not in STOP_TOKENS]
+
+
+    # Directory part of the URL path, used to group pages
+    def _directory(self, url):
+        parsed = urlparse(url)
+        return parsed.path.rsplit('/', 1)[0] + '/'
+
+
+    # Score a link, higher scores are visited first
+    def score(self, url, depth, anchor_text='', parent_url=None):
+
+        score = 0.0
+        anchor_lower = anchor_text.lower()
+        path_lower = urlparse(url).path.lower()
+
+        # Anchor text and URL path keywords
+        if any(keyword in anchor_lower for keyword in self.keywords):
+            score += ANCHOR_WEIGHT
+        if any(keyword in path_lower for keyword in self.keywords):
+            score += URL_WEIGHT
+
+        # Similarity with the URLs of pages that already yielded PDFs
+        tokens = self._tokens(url)
+        if tokens and self.yielding_pages:
+            similarity = sum(min(1.0, self.yield_tokens.get(t, 0) / self.yielding_pages) for t in tokens) / len(tokens)
+            score += SIMILARITY_WEIGHT * similarity
+
+        # PDF yield of the link directory, falling back to the directory of the parent page
+        stats = self.dir_stats.get(self._directory(url))
+        if stats is None and parent_url is not None:
+            stats = self.dir_stats.get(self._directory(parent_url))
+        if stats is not None:
+            pages, pdfs = stats
+            score += DIRECTORY_WEIGHT * min(1.0, pdfs / (pages + 1))
+
+        return score - DEPTH_PENALTY * depth
+
+
+    # Add a link to the frontier
+    def push(self, url, depth, anchor_text='', parent_url=None):
+        score = self.score(url, depth, anchor_text, parent_url)
+        heapq.heappush(self.heap, (-score, next(self.counter), self.version, url, depth, anchor_text, parent_url))
+
+
+    # Get the best link, rescoring it first if the statistics changed since it was pushed
+    def pop(self):
+        while True:
+            _, _, version, url, depth, anchor_text, parent_url = heapq.heappop(self.heap)
+
+            if version == self.version or not self.heap:
+                return url, depth
+
+            # Put the link back if it's no longer better than the next one
+            score = self.score(url, depth, anchor_text, parent_url)
+            if -score <= self.heap[0][0]:
+                return url, depth
+            heapq.heappush(self.heap, (-score, next(self.counter), self.version, url, depth, anchor_text, parent_url))
+
+
+    # Learn from a visited page how many new PDF links it contained
+    def record_page(self, url, pdf_count):
+
+        stats = self.dir_stats.setdefault(self._directory(url), [0, 0])
+        stats[0] += 1
+        stats[1] += pdf_count
+
+        if pdf_count:
+            self.yielding_pages += 1
+            for token in set(self._tokens(url)):
+                self.yield_tokens[token] = self.yield_tokens.get(token, 0) + 1
+
+        self.version += 1
+
+
+    # Load the statistics learned on previous runs
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+            self.dir_stats = state.get('dir_stats', {})
+            self.yield_tokens = state.get('yield_tokens', {})
+            self.yielding_pages = state.get('yielding_pages', 0)
+            logger.info("Loaded focused crawl state from %s", self.state_path)
+        except (OSError, ValueError) as e:
+            logger.error("Error loading focused crawl state from %s: %s", self.state_path, e)
+
+
+    # Save the statistics learned during the run
+    def save_state(self):
+        try:
+            folder = os.path.dirname(self.state_path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            with open(self.state_path, 'w', encoding='utf-8') as file:
+                json.dump({
+                    'dir_stats': self.dir_stats,
+                    'yield_tokens': self.yield_tokens,
+                    'yielding_pages': self.yielding_pages,
+                }, file)
+        except OSError as e:
+            logger.error("Error saving focused crawl state to %s: %s", self.state_path, e)
+
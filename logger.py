@@ -1,9 +1,123 @@
 import logging
+import logging.handlers
 import os
+import json
+import queue
+import random
+import threading
+import time
+import atexit
 from datetime import datetime
+from urllib.parse import urlparse
+from config import LOG_SAMPLE_RATES, LOG_MAX_EVENTS_PER_SECOND
+
+
+# Structured fields copied from the log record into each JSON line
+STRUCTURED_FIELDS = ('event', 'url', 'host', 'depth', 'status', 'latency')
+
+_listener = None  # Background listener writing the queued records
+_queue_handler = None  # Root handler feeding the listener queue
+
+
+# Format each record as a single JSON line
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+
+        # Add the structured fields passed with extra={...}
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+
+        # The host is derived here, off the hot path, when only the URL was given
+        if 'url' in entry and 'host' not in entry:
+            entry['host'] = urlparse(entry['url']).netloc
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# Sample and rate-limit high-volume events, warnings and errors always pass
+class EventSampler(logging.Filter):
+
+    def __init__(self, sample_rates=None, max_per_second=None):
+        super().__init__()
+        self.sample_rates = sample_rates or {}  # {event: fraction of records to keep}
+        self.max_per_second = max_per_second or {}  # {event: max records per second}
+        self._windows = {}  # {event: (second, count)}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+
+        event = getattr(record, 'event', None)
+        if event is None:
+            return True
+
+        # Keep only a fraction of the records for this event
+        rate = self.sample_rates.get(event)
+        if rate is not None and random.random() >= rate:
+            return False
+
+        # Allow at most N records per second for this event
+        limit = self.max_per_second.get(event)
+        if limit is not None:
+            second = int(time.monotonic())
+            with self._lock:
+                window, count = self._windows.get(event, (second, 0))
+                if window != second:
+                    count = 0
+                if count >= limit:
+                    return False
+                self._windows[event] = (second, count + 1)
+
+        return True
+
+
+# Queue handler that hands the raw record to the listener thread.
+# The default QueueHandler formats the message in the caller, which is what we want to avoid.
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        return record
+
+
+# Stop the listener and flush the queued records
+def stop_logger():
+    global _listener, _queue_handler
+
+    # Detach the handler first so no record is queued after the listener stops
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logger)  # Drain the queue when the program exits
+
 
 # Setup a logger for the application
-def setup_logger(log_level=logging.INFO):
+def setup_logger(log_level=logging.INFO, structured=True,
+                 sample_rates=LOG_SAMPLE_RATES, max_per_second=LOG_MAX_EVENTS_PER_SECOND):
+    global _listener, _queue_handler
+
+    # Drain and replace the listener of a previous setup
+    stop_logger()
 
     if not os.path.exists('logs'):
         os.makedirs('logs')
@@ -12,15 +126,25 @@ def setup_logger(log_level=logging.INFO):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     log_filename = f'logs/scraper_{timestamp}.log'
 
-    # Configure logging
-    logging.basicConfig(
-        level=log_level,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_filename, encoding='utf-8'),
+    # The file handler runs in the listener thread, so formatting and I/O happen there
+    file_handler = logging.FileHandler(log_filename, encoding='utf-8')
+    if structured:
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 
-        ]
-    )
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _listener.start()
+
+    # The queue handler only filters and enqueues records in the calling thread
+    _queue_handler = DeferredQueueHandler(log_queue)
+    _queue_handler.addFilter(EventSampler(sample_rates, max_per_second))
+
+    # Configure logging
+    root_logger = logging.getLogger()
+    root_logger.setLevel(log_level)
+    root_logger.addHandler(_queue_handler)
 
     # Create a logger for different components
     scraper_logger = logging.getLogger('scraper')
@@ -29,4 +153,3 @@ def setup_logger(log_level=logging.INFO):
 
     return log_filename
 
-
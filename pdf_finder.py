@@ -4,9 +4,14 @@ import requests
 import os
 from urllib.parse import urlparse
 from crawler import WebCrawler
-from config import DOWNLOAD_FOLDER, MAX_FILE_SIZE, USER_AGENT, DELAY_BETWEEN_REQUESTS
+from config import DOWNLOAD_FOLDER, MAX_FILE_SIZE, USER_AGENT, DELAY_BETWEEN_REQUESTS, FOCUSED_CRAWL, MAX_PAGES
+from config import OUTPUT_BACKEND, ARCHIVE_PAGES
+from storage import create_storage
 import time
 import re
+import sys
+import json
+import asyncio
 from tqdm import tqdm
 import threading
 
@@ -14,19 +19,37 @@ import threading
 import logging
 logger = logging.getLogger('downloader')  # Initialize a logger for the downloader
 
+SAVED_STATUSES = ('downloaded', 'exists')  # Result statuses with a usable file
+
 class PDFFinder:
 
     # PDFFinder initialization
-    def __init__(self,base_url, pdf_keywords=None, page_keywords=None):
+    def __init__(self,base_url, pdf_keywords=None, page_keywords=None, focused=FOCUSED_CRAWL, max_pages=MAX_PAGES,
+                 output_backend=OUTPUT_BACKEND, archive_pages=ARCHIVE_PAGES):
         self.base_url = base_url # Base URL to start crawling
         self.pdf_keywords = pdf_keywords or [] # List of keywords to filter PDF files
-        self.crawler = WebCrawler(base_url,page_keywords= page_keywords or []) # Initialize the WebCrawler with the base URL
+        self.storage = create_storage(output_backend) # Where the PDFs are saved, creates the download folder
+
+        # Initialize the WebCrawler with the base URL, wanted PDFs are the targets of the crawl
+        # and no PDF is fetched as a page in focused mode
+        self.crawler = WebCrawler(base_url,page_keywords= page_keywords or [],
+                                  target_filter=lambda url: self.is_pdf_link(url) and self.matches_keywords(url),
+                                  document_filter=self.is_pdf_link,
+                                  focused=focused, max_pages=max_pages,
+                                  page_archive=self.storage if archive_pages else None)
         self.session = requests.Session() # Initialize a session for making requests
         self.session.headers.update({'User-Agent': USER_AGENT}) # Initialize session with user agent
 
-        # Create the download folder if it doesn't exist
-        if not os.path.exists(DOWNLOAD_FOLDER):
-            os.makedirs(DOWNLOAD_FOLDER)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    # Close the storage, writing the central directory of the current ZIP shard
+    def close(self):
+        self.storage.close()
 
     # Find PDF links on the website
     def find_pdf_links(self):
@@ -91,11 +114,38 @@ class PDFFinder:
 
 
 
-    # Download the PDF file
+    # Download the PDF file, callers downloading several PDFs should wait DELAY_BETWEEN_REQUESTS between calls.
+    # With the zip backend the file is readable only after close(), use PDFFinder as a context manager.
     def download_pdf(self, url, filename=None):
 
+        result = self.fetch_pdf(url, filename, with_hash=False)
+
+        # Only downloaded or already existing files have a usable path
+        if result['status'] in SAVED_STATUSES:
+            return result['path']
+        return None
+
+
+    # Download the PDF file and return a result record describing the outcome
+    # with_hash=False skips hashing files that were already downloaded, their sha256 is then None
+    def fetch_pdf(self, url, filename=None, source_page=None, depth=None, with_hash=True):
+
+        started_at = time.time()
+        result = {
+            'url': url,
+            'path': None,
+            'size': None,
+            'sha256': None,
+            'source_page': source_page if source_page is not None else self.crawler.crawl_path.get(url),
+            'depth': depth,
+            'status': 'failed',
+            'error': None,
+            'started_at': started_at,
+            'elapsed': None,
+        }
+
         try:
-            logger.info(f"Downloading PDF from: {url}")
+            logger.info("Downloading PDF from: %s", url, extra={'event': 'pdf_request', 'url': url})
 
             # If no filename is provided, use the last part of the URL
             if filename is None:
@@ -116,12 +166,12 @@ class PDFFinder:
                     # Complete the filename with the download folder
                     filename = f"{domain}_{unique_id}.pdf"
 
-            filepath = os.path.join(DOWNLOAD_FOLDER, filename)
-
             # Check if the file already exists
-            if os.path.exists(filepath):
-                logger.debug(f"File already exists, skipping: {filename}.")
-                return filepath
+            saved = self.storage.lookup(filename, with_hash=with_hash)
+            if saved is not None:
+                logger.debug("File already exists, skipping: %s.", filename, extra={'event': 'pdf_exists', 'url': url})
+                result.update(saved, status='exists')
+                return result
 
             # Download the PDF file
             response = self.session.get(url, 
@@ -134,53 +184,151 @@ class PDFFinder:
             # Check content type to verify it's actually a PDF
             content_type = response.headers.get('Content-Type', '').lower()
             if 'pdf' not in content_type and not url.lower().endswith('.pdf'):
-                logger.warning(f"Warning: Content type is '{content_type}', may not be a PDF")
+                logger.warning("Warning: Content type is '%s', may not be a PDF", content_type, extra={'url': url})
 
             # Check file size before downloading
             content_length = response.headers.get('Content-Length')
             if content_length and int(content_length) > MAX_FILE_SIZE:
-                logger.warning(f"File too large ({content_length} bytes > {MAX_FILE_SIZE} bytes). Skipping.")
-                return None
+                logger.warning("File too large (%s bytes > %d bytes). Skipping.", content_length, MAX_FILE_SIZE, extra={'url': url})
+                result.update(size=int(content_length), status='too_large')
+                return result
 
 
 
-            # Save the PDF file
-            with open(filepath, 'wb') as file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:  # Filter out keep-alive chunks
-                        file.write(chunk)
+            # Save the PDF file, hashing it while it is written
+            saved = self.storage.store(filename, url, response.iter_content(chunk_size=8192),
+                                       content_type=content_type)
 
-            logger.info(f"Downloaded {filename} to {DOWNLOAD_FOLDER}")
-            time.sleep(DELAY_BETWEEN_REQUESTS)  # Delay between requests to avoid overloading the server
-            return filepath
+            logger.info("Downloaded %s to %s", filename, os.path.dirname(saved['path']),
+                        extra={'event': 'pdf_download', 'url': url, 'depth': depth,
+                               'status': response.status_code,
+                               'latency': round(time.time() - started_at, 3)})
+            result.update(saved, status='downloaded')
+            return result
         
         except requests.exceptions.ConnectionError as e:
             if "Failed to resolve" in str(e) or "getaddrinfo failed" in str(e):
-                logger.error(f"DNS resolution error for {url}. Check internet connection or try again later.")
+                logger.error("DNS resolution error for %s. Check internet connection or try again later.", url, extra={'event': 'pdf_error', 'url': url})
             else:
-                logger.error(f"Connection error downloading {url}: {e}")
-            return None
-        except requests.exceptions.Timeout:
-            logger.error(f"Timeout error downloading {url}. Server may be slow or unresponsive.")
-            return None
+                logger.error("Connection error downloading %s: %s", url, e, extra={'event': 'pdf_error', 'url': url})
+            result['error'] = str(e)
+            return result
+        except requests.exceptions.Timeout as e:
+            logger.error("Timeout error downloading %s. Server may be slow or unresponsive.", url, extra={'event': 'pdf_error', 'url': url})
+            result['error'] = str(e)
+            return result
         except requests.exceptions.HTTPError as e:
-            logger.error(f"HTTP error downloading {url}: Status code {e.response.status_code}")
-            return None
+            logger.error("HTTP error downloading %s: Status code %s", url, e.response.status_code,
+                         extra={'event': 'pdf_error', 'url': url, 'status': e.response.status_code})
+            result['error'] = f"HTTP {e.response.status_code}"
+            return result
         except requests.exceptions.RequestException as e:
-            logger.error(f"Network error downloading {url}: {e}")
-            return None
+            logger.error("Network error downloading %s: %s", url, e, extra={'event': 'pdf_error', 'url': url})
+            result['error'] = str(e)
+            return result
         except OSError as e:
-            logger.error(f"File system error saving {filename}: {e}")
-            return None
+            logger.error("File system error saving %s: %s", filename, e, extra={'event': 'pdf_error', 'url': url})
+            result['error'] = str(e)
+            return result
         except Exception as e:
-            logger.error(f"Unexpected error downloading {url}: {e}")
-            return None
+            logger.error("Unexpected error downloading %s: %s", url, e, extra={'event': 'pdf_error', 'url': url})
+            result['error'] = str(e)
+            return result
+        finally:
+            result['elapsed'] = time.time() - started_at
+
+
+    # Stream result records while crawling, downloading each PDF as soon as it is found
+    def iter_pdfs(self, max_downloads=None, event_stream=None, monitor_input=False):
+
+        logger.info(f"Starting streaming PDF search on {self.base_url}")
+
+        # Open the optional JSONL event stream ('-' means stdout)
+        stream, close_stream = self._open_event_stream(event_stream)
+
+        downloads = 0
+        try:
+            for link, parent_url, depth in self.crawler.iter_crawl(self.base_url, monitor_input=monitor_input):
+
+                # Skip links that are not PDFs or don't match the keywords
+                if not self.is_pdf_link(link) or not self.matches_keywords(link):
+                    continue
+
+                result = self.fetch_pdf(link, source_page=parent_url, depth=depth)
+
+                if stream is not None:
+                    stream.write(json.dumps(result) + '\n')
+                    stream.flush()
+
+                yield result
+
+                # Only saved PDFs count toward max_downloads
+                if result['status'] in SAVED_STATUSES:
+                    downloads += 1
+                    if max_downloads is not None and downloads >= max_downloads:
+                        break
+
+                # Delay between requests to avoid overloading the server, after the consumer got the result
+                if result['status'] == 'downloaded':
+                    time.sleep(DELAY_BETWEEN_REQUESTS)
+        finally:
+            self.storage.close()
+            if close_stream:
+                stream.close()
+
+
+    # Async version of iter_pdfs, the blocking work runs in a worker thread
+    async def aiter_pdfs(self, max_downloads=None, event_stream=None, monitor_input=False):
+
+        loop = asyncio.get_running_loop()
+        results = self.iter_pdfs(max_downloads, event_stream, monitor_input)
+        done = object()  # Sentinel returned when the generator is exhausted
+        pending = None  # Call to next() running in the worker thread
+
+        try:
+            while True:
+                # Shielded so a cancellation doesn't forget the call still running in the thread
+                pending = loop.run_in_executor(None, next, results, done)
+                result = await asyncio.shield(pending)
+                if result is done:
+                    break
+                yield result
+        finally:
+            # The generator can't be closed while next() is still running on it
+            if pending is not None and not pending.done():
+                try:
+                    await pending
+                except Exception:
+                    pass  # The task is being cancelled, only the cleanup below matters
+            await loop.run_in_executor(None, results.close)
+
+
+    # Open the JSONL event stream: a path, '-' for stdout or a file-like object
+    def _open_event_stream(self, event_stream):
+
+        if event_stream is None:
+            return None, False
+        if event_stream == '-':
+            return sys.stdout, False
+        if isinstance(event_stream, str):
+            return open(event_stream, 'a', encoding='utf-8'), True
+        return event_stream, False
 
 
 
     # Main method to find and download PDFs
     def run(self, max_downloads=None):  # Nessun limite di default
 
+        # Close the storage even on Ctrl+C or errors, or the current ZIP shard is left unreadable
+        try:
+            return self._run(max_downloads)
+        finally:
+            self.storage.close()
+
+
+    # Find and download PDFs, the body of run()
+    def _run(self, max_downloads=None):
+
         logger.info(f"Starting PDF search on {self.base_url}")
         logger.info(f"Base domain: {urlparse(self.base_url).netloc}")
         if self.pdf_keywords:
@@ -264,20 +412,24 @@ class PDFFinder:
 
 
                 pbar.set_description(f"[{i}/{len(pdf_links)}] Downloading {filename_display}")
-                logger.info(f"\n[{i}/{len(pdf_links)}] Downloading: {pdf_url}")
+                logger.info("[%d/%d] Downloading: %s", i, len(pdf_links), pdf_url)
 
-                filepath = self.download_pdf(pdf_url)
+                result = self.fetch_pdf(pdf_url, with_hash=False) # Only the path is used here
 
-                if filepath:
-                    downloaded_files.append(filepath)
+                if result['status'] in SAVED_STATUSES:
+                    downloaded_files.append(result['path'])
                 else:
                     failed_downloads += 1
                     pbar.set_description(f"Failed {filename_display}")
-                    logger.error(f"Failed to download {pdf_url}")
+                    logger.error("Failed to download %s", pdf_url)
     
                 # Update progress bar
                 pbar.update(1)
 
+                # Delay between requests to avoid overloading the server
+                if result['status'] == 'downloaded':
+                    time.sleep(DELAY_BETWEEN_REQUESTS)
+
 
         # Final progress bar logic
         elapsed = time.time() - start_time
@@ -296,7 +448,6 @@ class PDFFinder:
         logger.info(f"- Success rate: {success_rate:.1f}%")
         logger.info(f"- Download folder: {DOWNLOAD_FOLDER}")
         
-        
         return downloaded_files
 
 
@@ -1,4 +1,4 @@
-from config import MAX_DEPTH
+from config import MAX_DEPTH, FOCUSED_CRAWL, MAX_PAGES
 from pdf_finder import PDFFinder
 import sys
 import os
@@ -45,6 +45,8 @@ def main():
     print(f"PDF Keywords: {pdf_keywords if pdf_keywords else 'None'}")
     print(f"Page Keywords: {page_keywords if page_keywords else 'None'}")
     print(f"Max Depth: {MAX_DEPTH}")
+    print(f"Crawl Mode: {'focused' if FOCUSED_CRAWL else 'BFS'}")
+    print(f"Max Pages: {MAX_PAGES if MAX_PAGES else 'None'}")
 
     confirm = input("Do you want to proceed? (y/n): ").strip().lower()
     if confirm not in ['y', 'yes']:
@@ -53,8 +55,8 @@ def main():
     
     # Initialize the PDF finder
     try:
-        finder = PDFFinder(base_url, pdf_keywords, page_keywords)
-        downloaded_files = finder.run()
+        with PDFFinder(base_url, pdf_keywords, page_keywords) as finder:
+            downloaded_files = finder.run()
 
         print(f"\nFound and downloaded {len(downloaded_files)} PDF files:")
         logger.info(f"\nFound and downloaded {len(downloaded_files)} PDF files:")
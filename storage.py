@@ -0,0 +1,331 @@
+# Output backends used to save downloaded PDFs and, optionally, the crawled pages.
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import struct
+import tempfile
+import time
+import zipfile
+from config import DOWNLOAD_FOLDER, OUTPUT_BACKEND, SHARD_MAX_SIZE, SHARD_MAX_ENTRIES
+import logging
+
+
+logger = logging.getLogger('downloader')  # Storage logs through the downloader logger
+
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024  # Downloads bigger than this are spooled on disk before going in a shard
+
+
+
+# Save each document as a separate file in a folder
+class FolderStorage:
+
+    def __init__(self, folder=DOWNLOAD_FOLDER):
+        self.folder = folder # Folder where the files are saved
+
+        # Create the download folder if it doesn't exist
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+    # Check if a document is saved, without reading it
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.folder, name))
+
+    # Look for a saved document, returns {path, size, sha256} or None.
+    # Hashing reads the whole file, so the sha256 is None unless with_hash is set
+    def lookup(self, name, with_hash=False):
+        filepath = os.path.join(self.folder, name)
+        if not os.path.exists(filepath):
+            return None
+
+        sha256 = None
+        if with_hash:
+            digest = hashlib.sha256()
+            with open(filepath, 'rb') as file:
+                for chunk in iter(lambda: file.read(8192), b''):
+                    digest.update(chunk)
+            sha256 = digest.hexdigest()
+        return {'path': filepath, 'size': os.path.getsize(filepath), 'sha256': sha256}
+
+    # Save the chunks of a document, returns {path, size, sha256}
+    def store(self, name, url, chunks, kind='pdf', content_type=None):
+        filepath = os.path.join(self.folder, name)
+
+        # Names like pages/xxx.html need their subfolder
+        folder = os.path.dirname(filepath)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        size = 0
+        sha256 = hashlib.sha256()
+        with open(filepath, 'wb') as file:
+            for chunk in chunks:
+                if chunk:  # Filter out keep-alive chunks
+                    file.write(chunk)
+                    sha256.update(chunk)
+                    size += len(chunk)
+
+        return {'path': filepath, 'size': size, 'sha256': sha256.hexdigest()}
+
+    # Nothing to flush, files are closed after each download
+    def close(self):
+        pass
+
+
+
+# Append documents to size-capped ZIP shards, with a JSONL index for random access.
+# A shard is written once and never reopened for appending: a ZIP is readable only after its
+# central directory is written on close, so appending to a closed shard would put its old
+# entries at risk too if the program died.
+class ShardedZipStorage:
+
+    def __init__(self, folder=DOWNLOAD_FOLDER, prefix='shard', max_shard_size=SHARD_MAX_SIZE,
+                 max_shard_entries=SHARD_MAX_ENTRIES):
+        self.folder = folder # Folder where the shards and the index are saved
+        self.prefix = prefix # Shards are named <prefix>_00001.zip, <prefix>_00002.zip, ...
+        self.max_shard_size = max_shard_size # Start a new shard when the current one is this big
+        self.max_shard_entries = max_shard_entries # ... or has this many entries, limiting what a crash can affect
+        self.index_path = os.path.join(self.folder, 'index.jsonl')
+        self.zip = None # Current shard, opened on the first write
+        self.index_file = None
+
+        self.by_name = {} # {name: index entry}
+        self.by_url = {} # {url: index entry}
+        self.by_sha256 = {} # {sha256: index entry}
+
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+        # New shards are numbered after the ones of previous runs
+        self.shard_numbers = [int(m.group(1)) for m in
+                              (re.match(rf'{re.escape(self.prefix)}_(\d+)\.zip$', f) for f in os.listdir(self.folder)) if m]
+        self.shard_number = max(self.shard_numbers, default=0)
+
+        self.load_index()
+
+
+    # Path of a shard by number
+    def shard_path(self, number):
+        return os.path.join(self.folder, f"{self.prefix}_{number:05d}.zip")
+
+
+    # Path of a shard that doesn't exist yet
+    def _new_shard_path(self):
+        self.shard_number += 1
+        while os.path.exists(self.shard_path(self.shard_number)):
+            self.shard_number += 1
+        return self.shard_path(self.shard_number)
+
+
+    # Load the index written by previous runs, keeping only the entries that can be read back
+    def load_index(self):
+        entries = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        logger.warning("Skipping invalid line in %s", self.index_path)
+
+        # Names actually stored in each shard, a shard that can't be opened has none.
+        # Shards on disk are checked too, a run can die before indexing anything in its shard
+        shard_names = {}
+        damaged_shards = []
+        for shard in {entry['shard'] for entry in entries} | {self.shard_path(n) for n in self.shard_numbers}:
+            try:
+                with zipfile.ZipFile(shard, 'r') as zip_file:
+                    shard_names[shard] = set(zip_file.namelist())
+            except (OSError, zipfile.BadZipFile) as e:
+                logger.error("Shard %s can't be read: %s", shard, e)
+                shard_names[shard] = set()
+                if os.path.exists(shard):
+                    damaged_shards.append(shard)
+
+        valid_entries = [entry for entry in entries if entry['name'] in shard_names[entry['shard']]]
+
+        # Copy what can still be read from the damaged shards into a new shard
+        for shard in damaged_shards:
+            valid_entries.extend(self._salvage_shard(shard, [entry for entry in entries if entry['shard'] == shard]))
+
+        for entry in valid_entries:
+            self._add_to_index(entry)
+
+        # Rewrite the index without the entries that were dropped or moved
+        if len(valid_entries) != len(entries) or damaged_shards:
+            if len(valid_entries) != len(entries):
+                logger.warning("Dropped %d unreadable entries from %s", len(entries) - len(valid_entries), self.index_path)
+            with open(self.index_path, 'w', encoding='utf-8') as file:
+                for entry in valid_entries:
+                    file.write(json.dumps(entry) + '\n')
+
+        # The damaged shards are removed only once the index no longer points to them
+        for shard in damaged_shards:
+            os.remove(shard)
+
+
+    # Read the entries of a shard from their local headers, works without the central directory
+    def _read_local_entries(self, file):
+        while True:
+            header = file.read(30)
+            if len(header) < 30 or header[:4] != b'PK\x03\x04':
+                return
+
+            _, _, flag, method, _, _, _, compress_size, file_size, name_length, extra_length = \
+                struct.unpack('<4sHHHHHIIIHH', header)
+            name = file.read(name_length).decode('utf-8' if flag & 0x800 else 'cp437')
+            extra = file.read(extra_length)
+
+            # Entries are written with force_zip64, so the sizes are in the ZIP64 extra field
+            offset = 0
+            while offset + 4 <= len(extra):
+                field_id, field_length = struct.unpack_from('<HH', extra, offset)
+                if field_id == 0x0001:
+                    position = offset + 4
+                    if file_size == 0xFFFFFFFF:
+                        file_size, = struct.unpack_from('<Q', extra, position)
+                        position += 8
+                    if compress_size == 0xFFFFFFFF:
+                        compress_size, = struct.unpack_from('<Q', extra, position)
+                    break
+                offset += 4 + field_length
+
+            # Entries with a data descriptor or compression are not written by this class
+            if flag & 0x08 or method != zipfile.ZIP_STORED:
+                return
+
+            data = file.read(compress_size)
+            if len(data) < compress_size:
+                return
+            yield name, data
+
+
+    # Copy the entries of a damaged shard that match their index entry into a new shard
+    def _salvage_shard(self, shard, entries):
+        wanted = {entry['name']: entry for entry in entries}
+        salvaged = []
+        new_path = self._new_shard_path()
+
+        with open(shard, 'rb') as damaged_file, \
+                zipfile.ZipFile(new_path, 'w', compression=zipfile.ZIP_STORED) as new_zip:
+            for name, data in self._read_local_entries(damaged_file):
+                entry = wanted.pop(name, None)
+                if entry is None or hashlib.sha256(data).hexdigest() != entry['sha256']:
+                    continue
+                new_zip.writestr(name, data)
+                salvaged.append(dict(entry, shard=new_path))
+
+        if not salvaged:
+            os.remove(new_path)
+
+        logger.warning("Recovered %d of %d entries from damaged shard %s", len(salvaged), len(entries), shard)
+        return salvaged
+
+
+    def _add_to_index(self, entry):
+        self.by_name[entry['name']] = entry
+        self.by_url[entry['url']] = entry
+        self.by_sha256[entry['sha256']] = entry
+
+
+    def _describe(self, entry):
+        return {'path': os.path.join(entry['shard'], entry['name']), 'size': entry['size'], 'sha256': entry['sha256']}
+
+
+    # Check if a document is saved, using only the index
+    def exists(self, name):
+        return name in self.by_name
+
+    # Look for a saved document in the index, the sha256 is always known so with_hash is ignored
+    def lookup(self, name, with_hash=False):
+        entry = self.by_name.get(name)
+        return self._describe(entry) if entry else None
+
+
+    # Start a new shard, existing shards are never reopened for appending
+    def _open_shard(self):
+        self.zip = zipfile.ZipFile(self._new_shard_path(), 'w', compression=zipfile.ZIP_STORED)
+
+
+    # Append the chunks of a document to the current shard, returns {path, size, sha256}
+    def store(self, name, url, chunks, kind='pdf', content_type=None):
+
+        # Rotate the shard when it's full
+        if self.zip is not None and (self.zip.fp.tell() >= self.max_shard_size
+                                     or len(self.zip.filelist) >= self.max_shard_entries):
+            self.zip.close()
+            self.zip = None
+        if self.zip is None:
+            self._open_shard()
+
+        # Spool the whole download first, so a failed download never leaves a partial entry in the shard
+        size = 0
+        sha256 = hashlib.sha256()
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as spool:
+            for chunk in chunks:
+                if chunk:  # Filter out keep-alive chunks
+                    spool.write(chunk)
+                    sha256.update(chunk)
+                    size += len(chunk)
+
+            # PDFs are already compressed, entries are stored as they are
+            spool.seek(0)
+            with self.zip.open(name, 'w', force_zip64=True) as entry_file:
+                shutil.copyfileobj(spool, entry_file)
+
+        entry = {
+            'name': name,
+            'url': url,
+            'kind': kind,
+            'content_type': content_type,
+            'shard': self.zip.filename,
+            'size': size,
+            'sha256': sha256.hexdigest(),
+            'time': time.time(),
+        }
+
+        # Append the entry to the index
+        if self.index_file is None:
+            self.index_file = open(self.index_path, 'a', encoding='utf-8')
+        self.index_file.write(json.dumps(entry) + '\n')
+        self.index_file.flush()
+        self._add_to_index(entry)
+
+        return self._describe(entry)
+
+
+    # Read a saved document by URL, sha256 or name
+    def get(self, key):
+        entry = self.by_url.get(key) or self.by_sha256.get(key) or self.by_name.get(key)
+        if entry is None:
+            return None
+
+        # The current shard must be read through the open ZipFile
+        if self.zip is not None and entry['shard'] == self.zip.filename:
+            return self.zip.read(entry['name'])
+
+        with zipfile.ZipFile(entry['shard'], 'r') as shard:
+            return shard.read(entry['name'])
+
+
+    # Close the current shard, writing its central directory. The next write starts a new shard
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+            self.zip = None
+        if self.index_file is not None:
+            self.index_file.close()
+            self.index_file = None
+
+
+
+# Create the storage selected in the configuration
+def create_storage(backend=OUTPUT_BACKEND, folder=DOWNLOAD_FOLDER):
+    if backend == 'zip':
+        return ShardedZipStorage(folder)
+    if backend == 'folder':
+        return FolderStorage(folder)
+    raise ValueError(f"Unknown output backend: {backend}")
+